@@ -10,6 +10,7 @@ A minimal command-line interface for interacting with the DeepSeek Reasoner mode
 import os
 import sys
 import re
+import functools
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -65,6 +66,80 @@ MATH_SYMBOLS = {
     '+-': '±',
 }
 
+# Split MATH_SYMBOLS into whole-word names and literal operators, then build a
+# single alternation so all symbols are replaced in one pass over the text.
+# Longer keys are tried first so that e.g. '<=' wins over a shorter prefix.
+_WORD_SYMS = [s for s in MATH_SYMBOLS if len(s) > 1 and s.isalpha()]
+_LIT_SYMS = [s for s in MATH_SYMBOLS if s not in _WORD_SYMS]
+_SYM_RE = re.compile(
+    r'\b(' + '|'.join(map(re.escape, sorted(_WORD_SYMS, key=len, reverse=True))) + r')\b'
+    r'|(' + '|'.join(map(re.escape, sorted(_LIT_SYMS, key=len, reverse=True))) + r')'
+)
+
+# Characters that format_equation rewrites besides the MATH_SYMBOLS entries
+_EQUATION_TRIGGERS = ('=', '^', '/')
+
+# Superscript digits indexed by their value
+_SUPER_DIGITS = '⁰¹²³⁴⁵⁶⁷⁸⁹'
+
+# Single tokenizer for the symbol, fraction and superscript rewrites, so
+# format_equation scans the text once and dispatches on the matched group.
+# A variable superscript is limited to digits not already covered by the
+# '^2'..'^9' symbols, and absorbs a directly following fraction (x^1/2 -> x¹⁄2).
+# Digit runs are only matched from their first digit (or right after a '^2'..'^9'
+# symbol), which keeps long runs of digits from being rescanned at every offset.
+_TOKEN_RE = re.compile(
+    r'\b(?P<word>' + '|'.join(map(re.escape, sorted(_WORD_SYMS, key=len, reverse=True))) + r')\b'
+    r'|(?P<var>[xyzabcn])\^(?P<exp>(?![2-9])\d)(?:(?P<exp_num>\d*)/(?P<exp_den>\d+))?'
+    r'|(?:(?<!\d)|(?<=\^[2-9]))(?P<num>\d+)/(?P<den>\d+)'
+    r'|(?P<lit>' + '|'.join(map(re.escape, sorted(_LIT_SYMS, key=len, reverse=True))) + r')'
+)
+
+# ANSI codes for the streamed reasoning, concatenated directly at the print
+_CYAN = "\033[36m"
+_RESET = "\033[0m"
+
+# Longer input is returned unformatted to bound the worst-case formatting time
+MAX_FORMAT_LENGTH = 100_000
+
+# Precompiled patterns used by format_equation and highlight_equation
+_EQ_BLOCK_RE = re.compile(r'(?:^|\. |\n)([a-zA-Z0-9_]+\s*=\s*[^\.;!\?\n]+)')
+_OPERATOR_RE = re.compile(r'\s*([+\-*/=<>])\s*')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Display symbols for operators inside highlighted equations
+_OPERATOR_MAP = {'*': '×', '/': '÷', '-': '−'}  # Use minus sign instead of hyphen
+
+def has_equation_trigger(text: str) -> bool:
+    """
+    Check whether format_equation could change any part of the text.
+    
+    Args:
+        text: Text to inspect.
+        
+    Returns:
+        True if the text contains an equation trigger or a math symbol.
+    """
+    return any(trigger in text for trigger in _EQUATION_TRIGGERS) or _SYM_RE.search(text) is not None
+
+def _replace_token(match):
+    """Return the replacement for one _TOKEN_RE match."""
+    kind = match.lastgroup
+    # Replace common math symbols with their Unicode equivalents
+    # (word symbols only match whole words, operators match anywhere)
+    if kind in ('word', 'lit'):
+        return MATH_SYMBOLS[match.group(kind)]
+    # Handle fractions - convert a/b to ⁿ⁄ᵐ where possible
+    if kind == 'den':
+        return f"{match.group('num')}⁄{match.group('den')}"
+    # Handle superscripts for single digit numbers (x, y, z, a, b, c, n);
+    # the remaining kinds are 'exp' and 'exp_den'
+    result = match.group('var') + _SUPER_DIGITS[int(match.group('exp'))]
+    if match.group('exp_den'):
+        result += f"{match.group('exp_num')}⁄{match.group('exp_den')}"
+    return result
+
+@functools.lru_cache(maxsize=512)
 def format_equation(text: str) -> str:
     """
     Format mathematical equations for better display in terminal.
@@ -75,29 +150,13 @@ def format_equation(text: str) -> str:
     Returns:
         Text with equations formatted for better readability.
     """
-    # Replace common math symbols with their Unicode equivalents
-    for symbol, unicode_char in MATH_SYMBOLS.items():
-        # Use word boundaries for replacing whole words only
-        if len(symbol) > 1 and symbol.isalpha():
-            text = re.sub(r'\b' + symbol + r'\b', unicode_char, text)
-        else:
-            text = text.replace(symbol, unicode_char)
-    
-    # Handle fractions - convert a/b to ⁿ⁄ᵐ where possible
-    text = re.sub(r'(\d+)/(\d+)', r'\1⁄\2', text)
+    # Most text contains no math, so skip all substitutions when nothing can match
+    if len(text) > MAX_FORMAT_LENGTH or not has_equation_trigger(text):
+        return text
     
-    # Handle superscripts for single digit numbers
-    text = re.sub(r'x\^(\d)', lambda m: f'x{superscript(m.group(1))}', text)
-    text = re.sub(r'y\^(\d)', lambda m: f'y{superscript(m.group(1))}', text)
-    text = re.sub(r'z\^(\d)', lambda m: f'z{superscript(m.group(1))}', text)
-    text = re.sub(r'a\^(\d)', lambda m: f'a{superscript(m.group(1))}', text)
-    text = re.sub(r'b\^(\d)', lambda m: f'b{superscript(m.group(1))}', text)
-    text = re.sub(r'c\^(\d)', lambda m: f'c{superscript(m.group(1))}', text)
-    text = re.sub(r'n\^(\d)', lambda m: f'n{superscript(m.group(1))}', text)
+    # Replace math symbols, fractions and superscripts in a single pass
+    text = _TOKEN_RE.sub(_replace_token, text)
     
-    # Format inline equation blocks that match common patterns
-    text = re.sub(r'((?:\d+)?x\^2\s*(?:[-+]\s*\d+x)?\s*(?:[-+]\s*\d+)?)', lambda m: highlight_equation(m.group(1)), text)
-
     # Format equation blocks
     def format_eq_block(match):
         eq = match.group(1).strip()
@@ -116,44 +175,27 @@ def format_equation(text: str) -> str:
         return f"\n{top_line}\n{content_line}\n{bottom_line}\n"
     
     # Look for equation patterns like "x = y + z" at the beginning of lines or after punctuation
-    text = re.sub(r'(?:^|\. |\n)([a-zA-Z0-9_]+\s*=\s*[^\.;!\?\n]+)', format_eq_block, text)
+    text = _EQ_BLOCK_RE.sub(format_eq_block, text)
     
     return text
 
-def superscript(text):
-    """Convert text to superscript Unicode characters."""
-    superscript_map = {
-        '0': '⁰', '1': '¹', '2': '²', '3': '³', '4': '⁴',
-        '5': '⁵', '6': '⁶', '7': '⁷', '8': '⁸', '9': '⁹',
-        '+': '⁺', '-': '⁻', '=': '⁼', '(': '⁽', ')': '⁾',
-        'a': 'ᵃ', 'b': 'ᵇ', 'c': 'ᶜ', 'd': 'ᵈ', 'e': 'ᵉ',
-        'f': 'ᶠ', 'g': 'ᵍ', 'h': 'ʰ', 'i': 'ⁱ', 'j': 'ʲ',
-        'k': 'ᵏ', 'l': 'ˡ', 'm': 'ᵐ', 'n': 'ⁿ', 'o': 'ᵒ',
-        'p': 'ᵖ', 'r': 'ʳ', 's': 'ˢ', 't': 'ᵗ', 'u': 'ᵘ',
-        'v': 'ᵛ', 'w': 'ʷ', 'x': 'ˣ', 'y': 'ʸ', 'z': 'ᶻ'
-    }
-    return ''.join(superscript_map.get(char, char) for char in text)
-
+@functools.lru_cache(maxsize=128)
 def highlight_equation(eq):
     """Apply special formatting to highlight an equation."""
-    # Make sure it's properly spaced
-    eq = re.sub(r'([+\-*/=<>])', r' \1 ', eq)
-    eq = re.sub(r'\s+', ' ', eq).strip()
+    def space_operator(match):
+        op = match.group(1)
+        # Replace common patterns, leaving operators at either end of the equation as-is
+        if match.start() and match.end() < len(eq):
+            op = _OPERATOR_MAP.get(op, op)
+        return f' {op} '
     
-    # Replace common patterns
-    eq = eq.replace(' * ', ' × ')
-    eq = eq.replace(' / ', ' ÷ ')
-    eq = eq.replace(' - ', ' − ')  # Use minus sign instead of hyphen
-    
-    return eq
+    # Make sure it's properly spaced
+    spaced = _OPERATOR_RE.sub(space_operator, eq)
+    return _WHITESPACE_RE.sub(' ', spaced).strip()
 
-def init_client():
-    """
-    Initialize the OpenAI client with DeepSeek API configuration.
-    
-    Returns:
-        The configured OpenAI client.
-    """
+@functools.lru_cache(maxsize=1)
+def _get_client():
+    """Load the API key once per process and build the shared client."""
     # Load environment variables
     load_dotenv()
     
@@ -163,11 +205,19 @@ def init_client():
         raise ValueError("DeepSeek API key not found in environment variables")
     
     # Initialize client with compatible parameters
-    client = OpenAI(
+    return OpenAI(
         api_key=api_key,
         base_url="https://api.deepseek.com"
     )
-    return client
+
+def init_client():
+    """
+    Initialize the OpenAI client with DeepSeek API configuration.
+    
+    Returns:
+        The configured OpenAI client.
+    """
+    return _get_client()
 
 def colored_text(text: str, color_code: str) -> str:
     """
@@ -194,7 +244,8 @@ def format_box(text: str, width: int = 80, title: str = None) -> str:
     Returns:
         The formatted box as a string.
     """
-    lines = text.split('\n')
+    inner_width = width - 4
+    rule = "═" * (width - 2)
     result = []
     
     # Top border with optional title
@@ -203,18 +254,16 @@ def format_box(text: str, width: int = 80, title: str = None) -> str:
         padding = (width - len(title_str) - 2) // 2
         result.append("╔" + "═" * padding + title_str + "═" * (width - padding - len(title_str) - 2) + "╗")
     else:
-        result.append("╔" + "═" * (width - 2) + "╗")
+        result.append(f"╔{rule}╗")
     
     # Content
-    for line in lines:
-        # Handle lines longer than width by splitting them
-        while len(line) > width - 4:
-            result.append("║ " + line[:width - 4] + " ║")
-            line = line[width - 4:]
-        result.append("║ " + line + " " * (width - len(line) - 4) + " ║")
+    for line in text.split('\n'):
+        # Handle lines longer than width by splitting them into fixed-width slices
+        segments = [line[i:i + inner_width] for i in range(0, len(line), inner_width)] or [line]
+        result.extend(f"║ {segment.ljust(inner_width)} ║" for segment in segments)
     
     # Bottom border
-    result.append("╚" + "═" * (width - 2) + "╝")
+    result.append(f"╚{rule}╝")
     
     return "\n".join(result)
 
@@ -239,9 +288,11 @@ def get_response(client: Any, messages: List[Dict[str, str]], show_reasoning: bo
         )
         
         # Process streaming response
-        reasoning_content = ""
-        content = ""
-        reasoning_buffer = ""
+        # (text is collected in lists and joined once, avoiding repeated str copies)
+        reasoning_parts = []
+        content_parts = []
+        # Reasoning of the current sentence, held back until the sentence is complete
+        reasoning_buffer = []
         
         # Show reasoning process animation
         if show_reasoning:
@@ -249,35 +300,38 @@ def get_response(client: Any, messages: List[Dict[str, str]], show_reasoning: bo
             
         # Process stream chunks
         for chunk in response:
-            if hasattr(chunk.choices[0].delta, 'reasoning_content') and chunk.choices[0].delta.reasoning_content:
-                chunk_text = chunk.choices[0].delta.reasoning_content
-                reasoning_content += chunk_text
-                reasoning_buffer += chunk_text
+            # Look up the delta once per chunk
+            delta = chunk.choices[0].delta
+            chunk_text = getattr(delta, 'reasoning_content', None)
+            if chunk_text:
+                reasoning_parts.append(chunk_text)
                 
-                # Format and display reasoning in chunks for better responsiveness
+                # Format and display reasoning one sentence at a time, so equations and
+                # symbols split across chunks are formatted and each piece is printed once
                 if show_reasoning:
+                    reasoning_buffer.append(chunk_text)
+                    
                     # Check if we have a complete sentence or paragraph to format
                     if chunk_text.endswith('.') or chunk_text.endswith('\n'):
-                        formatted_chunk = format_equation(reasoning_buffer)
-                        print(colored_text(formatted_chunk, "36"), end="", flush=True)
-                        reasoning_buffer = ""
-                    else:
-                        # For partial text, just show without formatting
-                        print(colored_text(chunk_text, "36"), end="", flush=True)
+                        formatted_chunk = format_equation(''.join(reasoning_buffer))
+                        print(_CYAN + formatted_chunk + _RESET, end="", flush=True)
+                        reasoning_buffer.clear()
+                continue
             
-            elif hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
-                content += chunk.choices[0].delta.content
+            content_text = getattr(delta, 'content', None)
+            if content_text:
+                content_parts.append(content_text)
         
         # Display any remaining reasoning buffer
         if show_reasoning and reasoning_buffer:
-            formatted_chunk = format_equation(reasoning_buffer)
-            print(colored_text(formatted_chunk, "36"), end="", flush=True)
+            formatted_chunk = format_equation(''.join(reasoning_buffer))
+            print(_CYAN + formatted_chunk + _RESET, end="", flush=True)
         
         # Add a newline after reasoning
-        if show_reasoning and reasoning_content:
+        if show_reasoning and reasoning_parts:
             print("\n")
         
-        return content
+        return ''.join(content_parts)
     except Exception as e:
         print(f"\nError details: {type(e).__name__}: {str(e)}")
         return f"Error: {str(e)}"
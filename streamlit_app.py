@@ -16,6 +16,7 @@ import re
 import io
 import base64
 import tempfile
+import time
 import streamlit as st
 from typing import List, Dict, Any, Tuple, Optional
 from dotenv import load_dotenv
@@ -206,6 +207,46 @@ custom_css = """
 # Apply CSS
 st.markdown(custom_css, unsafe_allow_html=True)
 
+# Precompiled patterns used by format_code_blocks and format_equation
+_CODE_BLOCK_RE = re.compile(r'```(\w+)?\n(.*?)\n```', re.DOTALL)
+_STANDALONE_EQ_RE = re.compile(r'(?<!\$)((?:^|\n)[^\S\n]*[a-zA-Z0-9][^.\n]*?=.+?)(?:\n|$)')
+
+# Single tokenizer for the inline rewrites (powers, square roots, fractions,
+# Greek letters and products), so format_equation scans the text once and
+# dispatches on the matched group. A product is skipped when its right operand
+# runs into a fraction, which takes precedence (2*3/4 -> 2*$\frac{3}{4}$).
+# Numbers are only matched from their first digit, so long digit runs are not
+# rescanned at every offset.
+_TOKEN_RE = re.compile(
+    r'(?P<base>\b[a-zA-Z])\^(?P<power>\d+)'
+    r'|\bsqrt\((?P<radicand>[^()]+)\)'
+    r'|(?<!\d)(?P<num>\d+)/(?P<den>\d+)'
+    r'|\b(?P<greek>pi|alpha|beta|theta)\b'
+    r'|(?<!\d)(?P<left>\d+)\s*\*\s*(?P<right>\d+)(?!\d*/\d)'
+)
+
+# Characters and words that format_equation may rewrite
+_EQUATION_TRIGGERS = ('=', '^', '/', '\\', '*', 'sqrt', 'pi', 'alpha', 'beta', 'theta')
+
+# Longer input is returned unformatted to bound the worst-case formatting time
+MAX_FORMAT_LENGTH = 100_000
+
+# Maximum number of previous user/assistant turns sent with each request
+MAX_HISTORY_TURNS = 20
+
+# Minimum number of seconds between reasoning re-renders while streaming
+_RENDER_INTERVAL = 0.05
+
+@st.cache_resource
+def _formatter():
+    """Build the shared Pygments formatter for highlighted code blocks."""
+    return HtmlFormatter(style='monokai')
+
+@st.cache_resource(max_entries=32)
+def _lexer(lang: str):
+    """Look up (and cache) the Pygments lexer for a language name."""
+    return get_lexer_by_name(lang, stripall=True)
+
 # Code block detection and highlighting
 def format_code_blocks(text: str) -> str:
     """
@@ -217,18 +258,20 @@ def format_code_blocks(text: str) -> str:
     Returns:
         Formatted text with highlighted code blocks.
     """
+    # Skip the regex entirely when there is no code fence
+    if '```' not in text:
+        return text
+    
     # Pattern to match code blocks with language specification
     # Example: ```python\nprint("Hello")\n```
-    pattern = r'```(\w+)?\n(.*?)\n```'
+    # (see _CODE_BLOCK_RE above)
     
     def replace_code_block(match):
         lang = match.group(1) or 'text'
         code = match.group(2)
         
         try:
-            lexer = get_lexer_by_name(lang, stripall=True)
-            formatter = HtmlFormatter(style='monokai')
-            highlighted_code = pygments.highlight(code, lexer, formatter)
+            highlighted_code = pygments.highlight(code, _lexer(lang), _formatter())
             
             # Wrap the highlighted code in our custom div
             return f'<div class="code-block">{highlighted_code}</div>'
@@ -236,8 +279,38 @@ def format_code_blocks(text: str) -> str:
             # Fallback if language is not supported
             return f'<div class="code-block"><pre><code>{code}</code></pre></div>'
     
-    # Use re.DOTALL to match across multiple lines
-    return re.sub(pattern, replace_code_block, text, flags=re.DOTALL)
+    # _CODE_BLOCK_RE is compiled with re.DOTALL to match across multiple lines
+    return _CODE_BLOCK_RE.sub(replace_code_block, text)
+
+def _replace_token(match) -> str:
+    """Return the LaTeX replacement for one _TOKEN_RE match."""
+    kind = match.lastgroup
+    # Format inline equations with variables (like x^2, sqrt(x))
+    if kind == 'power':
+        return f"${match.group('base')}^{{{match.group('power')}}}$"
+    if kind == 'radicand':
+        # The radicand may itself contain powers, fractions, etc.
+        return f"$\\sqrt{{{_TOKEN_RE.sub(_replace_token, match.group('radicand'))}}}$"
+    # Format fractions
+    if kind == 'den':
+        return f"$\\frac{{{match.group('num')}}}{{{match.group('den')}}}$"
+    # Format common mathematical symbols (pi, alpha, beta, theta)
+    if kind == 'greek':
+        return f"$\\{match.group('greek')}$"
+    # Format certain operations
+    return f"${match.group('left')} \\times {match.group('right')}$"
+
+def has_equation_trigger(text: str) -> bool:
+    """
+    Check whether format_equation could change any part of the text.
+    
+    Args:
+        text: Text to inspect.
+        
+    Returns:
+        True if the text contains an equation trigger.
+    """
+    return any(trigger in text for trigger in _EQUATION_TRIGGERS)
 
 def format_equation(text: str) -> str:
     """
@@ -249,26 +322,15 @@ def format_equation(text: str) -> str:
     Returns:
         Formatted text with properly displayed equations.
     """
-    # Format standalone equations (equations on their own line)
-    text = re.sub(r'(?<!\$)((?:^|\n)[\s]*[a-zA-Z0-9]+[^.\n]*?=.+?)(?:\n|$)', r'\n$$\1$$\n', text)
+    # Most text contains no math, so skip all substitutions when nothing can match
+    if len(text) > MAX_FORMAT_LENGTH or not has_equation_trigger(text):
+        return text
     
-    # Format inline equations with variables (like x^2, sqrt(x))
-    text = re.sub(r'(\b[a-zA-Z])\^(\d+)', r'$\1^{\2}$', text)
-    text = re.sub(r'\bsqrt\(([^)]+)\)', r'$\\sqrt{\1}$', text)
-    
-    # Format fractions
-    text = re.sub(r'(\d+)/(\d+)', r'$\\frac{\1}{\2}$', text)
-    
-    # Format common mathematical symbols
-    text = re.sub(r'\bpi\b', r'$\\pi$', text)
-    text = re.sub(r'\balpha\b', r'$\\alpha$', text)
-    text = re.sub(r'\bbeta\b', r'$\\beta$', text)
-    text = re.sub(r'\btheta\b', r'$\\theta$', text)
-    
-    # Format certain operations
-    text = re.sub(r'(\d+)\s*\*\s*(\d+)', r'$\1 \\times \2$', text)
+    # Format standalone equations (equations on their own line)
+    text = _STANDALONE_EQ_RE.sub(r'\n$$\1$$\n', text)
     
-    return text
+    # Format inline math in a single pass
+    return _TOKEN_RE.sub(_replace_token, text)
 
 def preprocess_text(text: str) -> str:
     """
@@ -284,26 +346,36 @@ def preprocess_text(text: str) -> str:
     text = format_code_blocks(text)
     return text
 
+@st.cache_resource
+def _get_client():
+    """Load the API key once per server process and build the shared client."""
+    load_dotenv()
+    api_key = os.environ.get("DEEPSEEK_API_KEY")
+    if not api_key:
+        raise ValueError("DeepSeek API key not found in environment variables")
+    return OpenAI(
+        api_key=api_key,
+        base_url="https://api.deepseek.com"
+    )
+
 def initialize_session():
     """Initialize session state variables."""
     if 'messages' not in st.session_state:
         st.session_state.messages = []
     if 'reasoning_contents' not in st.session_state:
         st.session_state.reasoning_contents = []
+    if 'rendered' not in st.session_state:
+        st.session_state.rendered = [preprocess_text(msg["content"]) for msg in st.session_state.messages]
     if 'show_reasoning' not in st.session_state:
         st.session_state.show_reasoning = True
     if 'client' not in st.session_state:
-        load_dotenv()
-        api_key = os.environ.get("DEEPSEEK_API_KEY")
-        if not api_key:
+        try:
+            st.session_state.client = _get_client()
+        except ValueError:
             st.error("DeepSeek API key not found. Please set the DEEPSEEK_API_KEY environment variable.")
             st.stop()
-        st.session_state.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com"
-        )
 
-def get_response(prompt: str) -> Tuple[str, str]:
+def get_response(prompt: str) -> Tuple[str, str, Optional[str]]:
     """
     Get a response from the DeepSeek Reasoner model.
     
@@ -311,21 +383,16 @@ def get_response(prompt: str) -> Tuple[str, str]:
         prompt: The user prompt.
         
     Returns:
-        Tuple of (reasoning, answer).
+        Tuple of (reasoning, answer, formatted reasoning as streamed, or None
+        when reasoning is not shown).
     """
-    # Create a fresh conversation with proper alternating user/assistant messages
-    formatted_messages = []
-    
-    # First add any existing conversation history, ensuring alternating pattern
-    if len(st.session_state.messages) > 0:
-        for i in range(0, len(st.session_state.messages) - 1, 2):
-            # Add user message
-            if i < len(st.session_state.messages):
-                formatted_messages.append(st.session_state.messages[i])
-            
-            # Add assistant message
-            if i + 1 < len(st.session_state.messages):
-                formatted_messages.append(st.session_state.messages[i + 1])
+    # Create a fresh conversation from the existing history. Messages are appended
+    # in user/assistant pairs, so dropping an unpaired trailing message (the
+    # pending prompt) keeps the alternating pattern; only the most recent turns
+    # are sent so the request payload stays bounded.
+    history = st.session_state.messages
+    complete = len(history) - len(history) % 2
+    formatted_messages = history[max(0, complete - MAX_HISTORY_TURNS * 2):complete]
     
     # Add the current prompt as the last user message
     formatted_messages.append({"role": "user", "content": prompt})
@@ -338,8 +405,14 @@ def get_response(prompt: str) -> Tuple[str, str]:
                 stream=True
             )
             
-            reasoning_content = ""
-            content = ""
+            # (text is collected in lists and joined once, avoiding repeated str copies)
+            reasoning_parts = []
+            content_parts = []
+            
+            # Reasoning formatted so far and the raw text of the current, unfinished line
+            formatted_so_far = ""
+            pending_buffer = ""
+            last_render = time.monotonic()
             
             # Create placeholder for streaming content
             if st.session_state.show_reasoning:
@@ -347,26 +420,52 @@ def get_response(prompt: str) -> Tuple[str, str]:
             
             # Process stream chunks
             for chunk in response:
-                if hasattr(chunk.choices[0].delta, 'reasoning_content') and chunk.choices[0].delta.reasoning_content:
-                    chunk_text = chunk.choices[0].delta.reasoning_content
-                    reasoning_content += chunk_text
+                # Look up the delta once per chunk
+                delta = chunk.choices[0].delta
+                chunk_text = getattr(delta, 'reasoning_content', None)
+                if chunk_text:
+                    reasoning_parts.append(chunk_text)
                     
                     if st.session_state.show_reasoning:
-                        # Format math in reasoning
-                        formatted_reasoning = format_equation(reasoning_content)
-                        reasoning_placeholder.markdown(
-                            f'<div class="reasoning-box">{formatted_reasoning}</div>', 
-                            unsafe_allow_html=True
-                        )
+                        pending_buffer += chunk_text
+                        
+                        # Format math only up to the last completed line, so each line is
+                        # formatted exactly once and line-anchored patterns see real line starts
+                        flushed = '\n' in chunk_text
+                        if flushed:
+                            cut = pending_buffer.rfind('\n') + 1
+                            formatted_so_far += format_equation(pending_buffer[:cut])
+                            pending_buffer = pending_buffer[cut:]
+                        
+                        # Re-render on completed lines or at most every _RENDER_INTERVAL
+                        # seconds, rather than once per (often tiny) chunk
+                        now = time.monotonic()
+                        if flushed or now - last_render > _RENDER_INTERVAL:
+                            reasoning_placeholder.markdown(
+                                f'<div class="reasoning-box">{formatted_so_far}{pending_buffer}</div>', 
+                                unsafe_allow_html=True
+                            )
+                            last_render = now
+                    continue
                 
-                elif hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
-                    content += chunk.choices[0].delta.content
+                content_text = getattr(delta, 'content', None)
+                if content_text:
+                    content_parts.append(content_text)
+            
+            # Format any remaining reasoning and always display the final state
+            if st.session_state.show_reasoning and (formatted_so_far or pending_buffer):
+                formatted_so_far += format_equation(pending_buffer)
+                reasoning_placeholder.markdown(
+                    f'<div class="reasoning-box">{formatted_so_far}</div>', 
+                    unsafe_allow_html=True
+                )
             
-            return reasoning_content, content
+            formatted_reasoning = formatted_so_far if st.session_state.show_reasoning else None
+            return ''.join(reasoning_parts), ''.join(content_parts), formatted_reasoning
     
     except Exception as e:
         st.error(f"Error: {str(e)}")
-        return "", f"Error: {str(e)}"
+        return "", f"Error: {str(e)}", None
 
 def create_text_file(messages: List[Dict[str, str]]) -> str:
     """
@@ -420,25 +519,39 @@ def handle_input():
         # Clear input field
         st.session_state.user_input = ""
 
+def add_message(role: str, content: str):
+    """
+    Append a message to the history along with its rendered HTML.
+    
+    Args:
+        role: Message role ("user" or "assistant").
+        content: Raw message text.
+    """
+    st.session_state.messages.append({"role": role, "content": content})
+    st.session_state.rendered.append(preprocess_text(content))
+
 # Function to check if pending message is present and process it
 def process_pending_message():
     if 'pending_message' in st.session_state:
         user_message = st.session_state.pending_message
         
         # Add user message to history
-        st.session_state.messages.append({"role": "user", "content": user_message})
+        add_message("user", user_message)
         
         # Clear pending message
         del st.session_state.pending_message
         
         # Get response with reasoning
-        reasoning, answer = get_response(user_message)
+        reasoning, answer, formatted_reasoning = get_response(user_message)
         
-        # Store reasoning content
-        st.session_state.reasoning_contents.append(reasoning)
+        # Store reasoning content, already formatted for display; reuse the streamed
+        # copy when there is one so the box looks the same after a rerun
+        if formatted_reasoning is None:
+            formatted_reasoning = format_equation(reasoning)
+        st.session_state.reasoning_contents.append(formatted_reasoning)
         
         # Add assistant response to history
-        st.session_state.messages.append({"role": "assistant", "content": answer})
+        add_message("assistant", answer)
         
         # Force rerun outside of callback
         st.rerun()
@@ -482,15 +595,15 @@ def main():
         if st.button("Clear chat history", key="clear_history"):
             st.session_state.messages = []
             st.session_state.reasoning_contents = []
+            st.session_state.rendered = []
             st.rerun()
     
     # Display message history with reasoning
     for i, message in enumerate(st.session_state.messages):
         css_class = "user-message" if message["role"] == "user" else "bot-message"
-        content = message["content"]
         
-        # Apply formatting to the content
-        formatted_content = preprocess_text(content)
+        # Formatting was applied once when the message was added
+        formatted_content = st.session_state.rendered[i]
         
         # For assistant messages, show message and reasoning
         if message["role"] == "assistant":
@@ -504,10 +617,9 @@ def main():
                 # Display reasoning if available and enabled
                 reasoning_idx = i // 2
                 if st.session_state.show_reasoning and reasoning_idx < len(st.session_state.reasoning_contents):
-                    reasoning = st.session_state.reasoning_contents[reasoning_idx]
-                    if reasoning:
-                        # Format the reasoning with equation handling
-                        formatted_reasoning = format_equation(reasoning)
+                    formatted_reasoning = st.session_state.reasoning_contents[reasoning_idx]
+                    if formatted_reasoning:
+                        # Reasoning is stored with equation handling already applied
                         st.markdown(f'<div class="reasoning-box">{formatted_reasoning}</div>', unsafe_allow_html=True)
         else:
             # Display regular user message